@@ -1,2 +1,2 @@
-from p2kp2.reader import PassEntry, PassReader
-from p2kp2.writer import P2KP2, DbAlreadyExistsException, empty_db_path
+from p2kp2.reader import PassEntry, PassReader, DecryptionException
+from p2kp2.writer import P2KP2, DbAlreadyExistsException, ReservedKeyException, empty_db_path
@@ -6,40 +6,102 @@ import signal
 import sys
 from getpass import getpass
 from math import floor
+from queue import Queue
+from shutil import copymode
+from tempfile import mkstemp
+from threading import Thread, Lock
 
 from p2kp2 import PassReader, P2KP2, DbAlreadyExistsException
 
 
 def print_reader_progress(reader):
     nentries = len(reader.get_pass_entries())
+    last_percent = -1
 
     def print_progress(progress):
+        nonlocal last_percent
         percent = floor(100 * progress / nentries)
-        sys.stdout.write(f" > Reading password-store... {percent}%\r")
-        sys.stdout.flush()
+        if percent != last_percent:  # only write (and flush) when there's something new to show
+            last_percent = percent
+            sys.stdout.write(f" > Reading password-store... {percent}%\r")
+            sys.stdout.flush()
     reader.event_stream.subscribe(print_progress)
 
 
 def print_writer_progress(writer, nentries):
+    last_percent = -1
+
     def print_progress(progress):
+        nonlocal last_percent
         percent = floor(100 * progress / nentries)
-        sys.stdout.write(f" > Writing keepass database... {percent}%\r")
-        sys.stdout.flush()
+        if percent != last_percent:
+            last_percent = percent
+            sys.stdout.write(f" > Writing keepass database... {percent}%\r")
+            sys.stdout.flush()
     writer.event_stream.subscribe(print_progress)
 
 
+def print_conversion_progress(reader, writer):
+    nentries = len(reader.get_pass_entries())
+    percents = {"read": 0, "written": 0}
+    last_line = None
+    lock = Lock()  # reader and writer progress arrive from different threads
+
+    def print_progress():
+        nonlocal last_line
+        line = f" > Converting password-store... read {percents['read']}%, written {percents['written']}%\r"
+        if line != last_line:
+            last_line = line
+            sys.stdout.write(line)
+            sys.stdout.flush()
+
+    def update(counter):
+        def on_progress(progress):
+            with lock:
+                percents[counter] = floor(100 * progress / nentries)
+                print_progress()
+        return on_progress
+    reader.event_stream.subscribe(update("read"))
+    writer.event_stream.subscribe(update("written"))
+
+
+def stream_entries(reader):
+    """Parse the password-store in a background thread, yielding every entry as soon as it's decrypted.
+
+    Closing the generator (or an error while waiting for entries) stops the parsing too.
+    """
+    entries = Queue()
+    errors = []
+    reader.entry_stream.subscribe(entries.put)
+
+    def produce():
+        try:
+            reader.parse_db()
+        except Exception as e:
+            errors.append(e)
+        finally:
+            entries.put(None)  # no more entries
+    Thread(target=produce, daemon=True).start()
+    try:
+        yield from iter(entries.get, None)
+    finally:
+        reader.stop()  # no-op if the parsing is already over
+    if len(errors) > 0:
+        raise errors[0]
+
+
 def exec_normal_mode(args):
     """Interactive script."""
+    in_path = os.path.abspath(os.path.expanduser(args.input if args.input is not None else "~/.password-store"))
+    out_path = os.path.abspath(args.output if args.output is not None else "pass.kdbx")
     # Intro message and warnings
     intro = "Welcome! pass2keepass2 will convert your pass database into a keepass2 one.\n\n" \
             "> WARNING < This script DOES NOT try to be memory secure: your password will NOT be " \
             "encrypted while in memory, so you probably want to execute this on a trusted hardware.\n\n" \
             "The script will now read your input password-store, so you will probably be asked to " \
             "unlock it.\nKeep in mind this may take a while, depending on the number of entries.\n\n" \
-            "Input password-store: {}\n" \
-            "Output keepass2 database: {}\n" \
-        .format(os.path.abspath(args.input) if args.input is not None else os.path.expanduser("~/.password-store"),
-                os.path.abspath(args.output) if args.output is not None else os.path.abspath("pass.kdbx"))
+            f"Input password-store: {in_path}\n" \
+            f"Output keepass2 database: {out_path}\n"
     print(intro)
     answer = input("Are you ready to proceed? [Y/n] ")
     if not (answer.lower() == "y" or answer.lower() == ""):
@@ -49,7 +111,7 @@ def exec_normal_mode(args):
     # Read the pass db
     print("\r")
     try:
-        reader = PassReader(path=args.input)
+        reader = PassReader(path=in_path)
     except Exception:
         print(">> ERROR: error while reading the password-store.")
         exit(1)
@@ -81,7 +143,7 @@ def exec_normal_mode(args):
         print("")
         sys.stdout.write(f" > Creating the new keepass database... 0%\r")
         sys.stdout.flush()
-        p2kp2 = P2KP2(password=password, destination=args.output, overwrite=args.force_overwrite)
+        p2kp2 = P2KP2(password=password, destination=out_path, overwrite=args.force_overwrite)
         sys.stdout.write(f" > Creating the new keepass database... 100%\r")
         sys.stdout.flush()
     except DbAlreadyExistsException:
@@ -107,6 +169,7 @@ def exec_normal_mode(args):
 
 def exec_quick_mode(args):
     """More automated script"""
+    out_path = os.path.abspath(args.output if args.output is not None else "pass.kdbx")
     print("Insert the password that will be used for decrypting the pass "
           "store and encrypting the new keepass db:")
     password = getpass("-> ")
@@ -116,41 +179,59 @@ def exec_quick_mode(args):
         print(">> ERROR: error while reading the password-store.")
         exit(1)
 
-    try:
-        print_reader_progress(reader)
-        reader.parse_db()
-    except Exception:
-        print("")
-        print("\n>> ERROR: error while parsing the password-store entries.")
-        exit(1)
-
+    # the keepass db password is already known: create the db first, so that entries can be added
+    # while the rest of the password-store is still being decrypted. It's written to a temporary file
+    # next to the destination, that takes its place only when the conversion is done: this way a failed
+    # conversion never touches an already existing db. A missing destination is reserved right away,
+    # so that nothing else can take it in the meantime
+    reserved = False
     try:
         print("")
         sys.stdout.write(f" > Creating the new keepass database... 0%\r")
         sys.stdout.flush()
-        p2kp2 = P2KP2(password=password, destination=args.output, overwrite=args.force_overwrite)
-        sys.stdout.write(f" > Creating the new keepass database... 100%\r")
-        sys.stdout.flush()
-    except DbAlreadyExistsException:
-        print("")
-        print("\n>> ERROR: keepass database file already exists! "
-              "Use -f if you want to force overwriting.")
-        exit(1)
+        os.close(os.open(out_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o666))
+        reserved = True
+    except FileExistsError:
+        if not args.force_overwrite:
+            print("")
+            print("\n>> ERROR: keepass database file already exists! "
+                  "Use -f if you want to force overwriting.")
+            exit(1)
     except Exception:
         print("")
         print("\n>> ERROR: error while writing the new db.")
         exit(1)
 
+    tmp_path = None
+    converted = False
+    pass_entries = stream_entries(reader)
     try:
+        tmp_fd, tmp_path = mkstemp(dir=os.path.dirname(out_path), suffix=".kdbx.part")
+        os.close(tmp_fd)
+        # same mode P2KP2 would give it: the reserved file one (from the umask) or the overwritten db one
+        copymode(out_path, tmp_path)
+        p2kp2 = P2KP2(password=password, destination=tmp_path, overwrite=True)
+        sys.stdout.write(f" > Creating the new keepass database... 100%\r")
+        sys.stdout.flush()
         print("")
-        print_writer_progress(p2kp2, len(reader.entries))
-        p2kp2.populate_db(reader)
+        print_conversion_progress(reader, p2kp2)
+        # on errors the db is deleted anyway: don't wait for it to be saved first
+        p2kp2.add_entries(pass_entries, save_on_error=False)
+        os.replace(tmp_path, out_path)
+        converted = True
         print("")
         print("ALL DONE! {} entries converted! Bye!".format(len(p2kp2.db.entries)))
     except Exception:
         print("")
-        print("\n>> ERROR: error while adding entries to the new db.")
+        print("\n>> ERROR: error while converting the password-store entries.")
         exit(1)
+    finally:
+        # on errors or ctrl-c stop decrypting, and don't leave the temporary db (or the reserved file) behind
+        pass_entries.close()
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        if reserved and not converted:
+            os.remove(out_path)
 
 
 def main_func():
@@ -1,18 +1,26 @@
 import os
-from typing import List, Dict, Tuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from threading import Event
+from typing import List, Dict, Tuple, Iterator, FrozenSet, Optional
 
+from gnupg import GPG
 from passpy import Store
-from passpy.gpg import read_key
 from rx.subject import Subject
 
 PassEntryCls = "PassEntry"
 
 
+class DecryptionException(Exception):
+    """gpg could not decrypt a pass entry (wrong passphrase, cancelled pinentry, missing key...)."""
+
+
 class PassReader:
     """Read a pass db and construct an in-memory version of it."""
 
     entries: List[PassEntryCls]
     store: Store
+    _gpg: Optional[GPG]  # created on first use
+    _pass_entries: Optional[List[str]]  # entries name, once the store has been scanned
 
     def __init__(self, path: str = None, password: str = None):
         """Constructor for PassReader
@@ -21,48 +29,149 @@ class PassReader:
             Default is '~/.password-store'.
         """
         if path is None:
-            self.path = os.path.expanduser("~/.password-store")
-        else:
-            self.path = os.path.abspath(os.path.expanduser(path))
+            path = "~/.password-store"
+        self.path = os.path.abspath(os.path.expanduser(path))
         self.store = Store(store_dir=self.path)
         self.entries = []
+        self._pass_entries = None
         self.password = password
-        self.event_stream = Subject()
+        self._gpg = None
+        self.event_stream = Subject()  # number of entries parsed so far
+        self.entry_stream = Subject()  # every PassEntry, as soon as it's parsed
+        self._stopping = Event()
+
+    def get_gpg(self) -> GPG:
+        """Return the gpg handle shared by all entries decryption.
+
+        Creating a handle spawns gpg to probe its version, so it's done only once, the first time it's needed.
+        """
+        if self._gpg is None:
+            gpg_opts = self.store.gpg_opts
+            if self.password is not None and self.password != "":
+                gpg_opts = gpg_opts + ["--pinentry-mode=loopback", f"--passphrase={self.password}"]
+            self._gpg = GPG(gpgbinary=self.store.gpg_bin, options=gpg_opts)
+        return self._gpg
 
     def get_pass_entries(self) -> List[str]:
-        """Returns all store entries."""
-        return self._get_entries_at_path()
+        """Returns all store entries.
+
+        The store is scanned only the first time, later calls (like parse_db) reuse the same list.
+        """
+        if self._pass_entries is None:
+            self._pass_entries = list(self.iter_pass_entries())
+        return self._pass_entries
 
-    def _get_entries_at_path(self, path: str = "/") -> List[str]:
+    def iter_pass_entries(self) -> Iterator[str]:
+        """Walk the store and yield every entry name.
+
+        Hidden folders (like .git) are not visited at all, since pass ignores them anyway.
+
+        :raises OSError: if the store, or one of its folders, can't be read
+        """
+        return self._iter_entries_at_path(self.path, os.path.realpath(self.path), frozenset())
+
+    def _iter_entries_at_path(self, path: str, real_path: str, parents: FrozenSet[str]) -> Iterator[str]:
         """Recursive scan of a store path.
 
-        :param path: the path to scan, default at root
-        :return: a list of entries name
+        Symlinked folders are followed, like pass does, unless they point back to one of their parents.
+
+        :param path: the absolute path to scan
+        :param real_path: the same path, with no symlinks in it
+        :param parents: real paths of the folders being scanned above this one
+        :return: a generator of entries name
         """
-        folders, entries = self.store.list_dir(self.path + path)
-        if len(folders) > 0:
-            for folder in folders:
-                for entry in self._get_entries_at_path("/{}".format(folder)):
-                    entries.append(entry)
-        return entries
+        parents = parents | {real_path}
+        with os.scandir(path) as dir_entries:
+            # same order as pass: alphabetical, entries in a folder before the ones in its subfolders
+            dir_entries = sorted(dir_entries, key=lambda x: x.name.lower())
+        folders = []
+        for dir_entry in dir_entries:
+            if dir_entry.name.startswith("."):
+                continue
+            if dir_entry.is_dir():
+                # only symlinks need to be resolved, the real path of any other folder comes from its parent one
+                if dir_entry.is_symlink():
+                    real_folder = os.path.realpath(dir_entry.path)
+                else:
+                    real_folder = os.path.join(real_path, dir_entry.name)
+                if real_folder not in parents:
+                    folders.append((dir_entry.path, real_folder))
+            elif dir_entry.is_file() and dir_entry.name.endswith(".gpg"):
+                yield dir_entry.path[len(self.path) + 1:-4]
+        for folder, real_folder in folders:
+            yield from self._iter_entries_at_path(folder, real_folder, parents)
 
     def parse_pass_entry(self, entry: str) -> PassEntryCls:
         """Return a parsed PassEntry."""
         return PassEntry(reader=self, entry=entry)
 
+    def _parse_pass_entry_unless_stopped(self, entry: str) -> Optional[PassEntryCls]:
+        """Return a parsed PassEntry, or None without decrypting anything if parse_db has been stopped."""
+        if self._stopping.is_set():
+            return None
+        return self.parse_pass_entry(entry)
+
+    def stop(self):
+        """Ask a running parse_db (maybe in another thread) to return as soon as possible.
+
+        The entries not decrypted yet are skipped, so the entries list will be incomplete.
+        """
+        self._stopping.set()
+
     def parse_db(self):
-        """Populate the entries list with all the data from the pass db."""
-        i = 0
-        for entry in self.get_pass_entries():
-            self.entries.append(self.parse_pass_entry(entry))
-            i = i + 1
-            self.event_stream.on_next(i)
+        """Populate the entries list with all the data from the pass db.
+
+        Every entry needs its own gpg process, so they are decrypted concurrently; the entries
+        list still follows the store order. The first one is decrypted alone, before the others:
+        this way gpg-agent unlocks the key (asking for its passphrase, if needed) just once and
+        keeps it cached for all the workers. If that fails, no worker is started at all.
+
+        Every parsed entry is published on entry_stream, in the store order, as soon as it and the ones
+        before it are parsed.
+        """
+        self.get_gpg()  # create the shared handle before any worker needs it
+        pass_entries = iter(self.get_pass_entries())
+        first_entry = next(pass_entries, None)
+        if first_entry is None:
+            return
+        entry = self.parse_pass_entry(first_entry)
+        self.entries.append(entry)
+        self.entry_stream.on_next(entry)
+        self.event_stream.on_next(1)
+        if self._stopping.is_set():
+            return
+        with ThreadPoolExecutor(max_workers=(os.cpu_count() or 1) * 2) as executor:
+            # once stopped, the workers skip the entries they still have to start
+            futures = [executor.submit(self._parse_pass_entry_unless_stopped, entry) for entry in pass_entries]
+            try:
+                published = 0
+                for i, future in enumerate(as_completed(futures), start=2):
+                    future.result()
+                    if self._stopping.is_set():  # before publishing: skipped entries are not entries at all
+                        for future in futures:
+                            future.cancel()
+                        return
+                    self.event_stream.on_next(i)
+                    # publish in store order, as soon as all the entries before are ready too
+                    while published < len(futures) and futures[published].done():
+                        self.entry_stream.on_next(futures[published].result())
+                        published = published + 1
+            except BaseException:
+                # on errors (or ctrl-c) leaving the executor would wait for every queued entry to be decrypted:
+                # stop the workers, so that they don't start any other entry, and drop the queued ones
+                self.stop()
+                for future in futures:
+                    future.cancel()
+                raise
+        # keep the store order, whatever the order they were decrypted in
+        self.entries.extend(future.result() for future in futures)
 
 
 class PassEntry:
     """A simple pass entry in-memory representation"""
 
-    to_skip: List[str] = ["---", ""]  # these lines will be skipped when parsing
+    to_skip: FrozenSet[str] = frozenset({"---", ""})  # these lines will be skipped when parsing
+    fields: Dict[str, str] = {"url": "url", "user": "user", "login": "user", "notes": "notes"}  # key -> attribute
 
     groups: List[str]
     title: str
@@ -70,7 +179,7 @@ class PassEntry:
     url: str
     user: str
     notes: str
-    custom_properties: Dict[str, str]
+    custom_properties: List[Tuple[str, str]]  # (key, value) pairs, in the order they were found
 
     def __init__(self, reader: PassReader, entry: str):
         """Constructor for PassEntry.
@@ -81,61 +190,40 @@ class PassEntry:
         self.url = ""
         self.user = ""
         self.notes = ""
-        self.custom_properties = {}
-        self.groups = self.get_groups(entry)
-        self.title = self.get_title(entry)
+        self.custom_properties = []
+        *self.groups, self.title = entry.split("/")  # split just once for both groups and title
         entry_string = self.decrypt_entry(reader, entry)
         self.parse_entry_string(entry_string)
 
-    @staticmethod
-    def get_title(entry: str) -> str:
-        """Return the entry title."""
-        return entry.split("/").pop()
-
-    @staticmethod
-    def get_groups(entry: str) -> List[str]:
-        """Return the entry groups."""
-        groups = entry.split("/")
-        groups.pop()
-        return groups
-
     @staticmethod
     def decrypt_entry(reader: PassReader, entry: str) -> str:
-        """Decrypt the entry using pass and return it as a string."""
-        if reader.password is None or reader.password == "":
-            entry = reader.store.get_key(entry)
-        else:
-            # implement my own get_key and pass a custom gpg pass
-            gpg_opts = reader.store.gpg_opts + ["--pinentry-mode=loopback", f"--passphrase={reader.password}"]
-            entry = read_key(reader.path + f"/{entry}.gpg", reader.store.gpg_bin, gpg_opts)
-        return entry
-
-    @staticmethod
-    def is_valid_line(entry_line: str) -> bool:
-        """Accept as valid only lines in the format of 'key: value'."""
-        return entry_line.find(":") > 0
+        """Decrypt the entry using the reader gpg handle and return it as a string.
 
-    @staticmethod
-    def parse_entry_line(entry_line: str) -> Tuple[str, str]:
-        """Parse a line in the format 'key: value'."""
-        data = entry_line.split(":", 1)
-        return data[0].strip(), data[1].strip()
+        :raises DecryptionException: if gpg fails to decrypt the entry
+        """
+        with open(reader.path + f"/{entry}.gpg", "rb") as entry_file:
+            result = reader.get_gpg().decrypt_file(entry_file)
+        if not result.ok:
+            raise DecryptionException(f"Unable to decrypt '{entry}': {result.status}")
+        return str(result)
 
     def parse_entry_string(self, entry_string: str) -> None:
-        """Parse a entry and extract all useful data."""
-        lines = entry_string.split("\n")
-        self.password = lines.pop(0)
-
-        lines = list(filter(lambda x: x not in self.to_skip and self.is_valid_line(x), lines))
-        data = list(map(lambda x: self.parse_entry_line(x), lines))
-        for key, value in data:
-            if key == "url":
-                self.url = value
-            elif key == "user" or key == "login":
-                self.user = value
-            elif key == "notes":
-                self.notes = value
+        """Parse a entry and extract all useful data, in a single pass over its lines."""
+        lines = iter(entry_string.split("\n"))
+        self.password = next(lines)
+        for line in lines:
+            if line in self.to_skip:
+                continue
+            # accept as valid only lines in the format of 'key: value'
+            separator = line.find(":")
+            if separator <= 0:
+                continue
+            key = line[:separator].strip()
+            value = line[separator + 1:].strip()
+            field = self.fields.get(key)
+            if field is not None:
+                setattr(self, field, value)
             elif key == "otpauth":
-                self.custom_properties.update({"otp": f"otpauth:{value}"})
+                self.custom_properties.append(("otp", f"otpauth:{value}"))
             else:
-                self.custom_properties.update({key: value})
+                self.custom_properties.append((key, value))
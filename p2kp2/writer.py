@@ -1,9 +1,13 @@
 import os
+from itertools import chain
 import pkg_resources
-from shutil import copyfile
+from shutil import copyfile, copyfileobj
+from typing import Dict, Tuple, Iterable
 
+from lxml.builder import E
 from pykeepass import PyKeePass
-from pykeepass.entry import Entry
+from pykeepass.entry import Entry, reserved_keys
+from pykeepass.group import Group
 from rx.subject import Subject
 
 from p2kp2 import PassReader, PassEntry
@@ -15,60 +19,98 @@ class DbAlreadyExistsException(Exception):
     """Trying to overwrite an already existing keepass db."""
 
 
+class ReservedKeyException(Exception):
+    """A pass entry custom property has the same name of a standard keepass field (like Password or Title)."""
+
+
 class P2KP2:
     """Convert a Pass db into a Keepass2 one."""
 
     db: PyKeePass
+    _root_group: Group
+    _groups: Dict[Tuple[str, ...], Group]  # groups already in the db, by path
 
     def __init__(self, password: str, destination: str = None, overwrite: bool = False):
         """Constructor for P2KP2
 
+        The new file is a copy of the empty db: the password is only written to it on the first save,
+        that is when populate_db or add_entries are done.
+
         :param password: the password for the new Keepass db
         :param destination: the final db path
         :param overwrite: force writing over existing database
         """
         if destination is None:
             destination = "pass.kdbx"
-        if not os.path.exists(destination) or overwrite:
+        if overwrite:
             copyfile(empty_db_path, destination)
         else:
-            raise DbAlreadyExistsException()
+            # check and create the new file in a single atomic call
+            try:
+                fd = os.open(destination, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o666)
+            except FileExistsError:
+                raise DbAlreadyExistsException()
+            with os.fdopen(fd, "wb") as db_file, open(empty_db_path, "rb") as empty_db:
+                copyfileobj(empty_db, db_file)
         self.db = PyKeePass(destination)
         self.db.password = password
-        self.db.save()
+        self._root_group = self.db.root_group  # db.root_group runs a group search on every access
+        self._groups = {(): self._root_group}
         self.event_stream = Subject()
 
     def populate_db(self, pass_reader: PassReader):
         """Populate the keepass db with data from the PassReader."""
-        i = 0
-        for pass_entry in pass_reader.entries:
-            self.add_entry(pass_entry)
-            i = i + 1
-            self.event_stream.on_next(i)
-        self.db.save()
+        self.add_entries(pass_reader.entries)
+
+    def add_entries(self, pass_entries: Iterable[PassEntry], save_on_error: bool = True):
+        """Add all the given entries to the db, consuming them as they come, then save it.
+
+        The db is saved only once, after all entries have been added. On errors the entries added so far
+        are saved anyway, unless save_on_error is False.
+
+        :param pass_entries: the entries to add
+        :param save_on_error: save the db even if adding the entries fails (or is interrupted)
+        """
+        added = False
+        try:
+            i = 0
+            for pass_entry in pass_entries:
+                self.add_entry(pass_entry)
+                i = i + 1
+                self.event_stream.on_next(i)
+            added = True
+        finally:
+            if added or save_on_error:
+                self.db.save()
 
     def add_entry(self, pass_entry: PassEntry) -> Entry:
         """Add a keepass entry to the db containing all data from the relative pass entry. Create the group if needed.
 
         :param pass_entry: the original pass entry
         :return: the newly added keepass entry
+        :raises ReservedKeyException: if a custom property would overwrite a standard field, like the password
         """
+        custom_properties = dict(pass_entry.custom_properties)  # a key found twice keeps its last value
+        for key in custom_properties:
+            if key in reserved_keys:
+                raise ReservedKeyException(f"{key} is a reserved key")
         # find the correct group for the entry. If not there, create it
-        entry_group = self.db.root_group  # start from the root group
-        if len(pass_entry.groups) > 0:
-            for group_name in pass_entry.groups:
-                # since pass folder names are unique, the possible first result is also the only one
-                group = self.db.find_groups(name=group_name, recursive=False, group=entry_group, first=True)
-                if group is None:
-                    # the group is not already there, let's create it
-                    group = self.db.add_group(destination_group=entry_group, group_name=group_name)
-                entry_group = group
-        # create the entry, setting group, title, user and pass
-        entry = self.db.add_entry(entry_group, pass_entry.title, pass_entry.user, pass_entry.password)
-        # set the url and the notes
-        entry.url = pass_entry.url
-        entry.notes = pass_entry.notes
-        # add all custom fields
-        for pass_entry, value in pass_entry.custom_properties.items():
-            entry.set_custom_property(pass_entry, value)
+        entry_group = self._root_group  # start from the root group
+        path = ()
+        for group_name in pass_entry.groups:
+            path = path + (group_name,)
+            group = self._groups.get(path)
+            if group is None:
+                # the group is not already there, let's create it
+                group = self.db.add_group(destination_group=entry_group, group_name=group_name)
+                self._groups[path] = group
+            entry_group = group
+        # build the whole entry element before attaching it to its group. Skipping add_entry also skips its
+        # duplicate title search: pass file names are unique in a folder, so titles are unique in a group
+        entry = Entry(title=pass_entry.title, username=pass_entry.user, password=pass_entry.password, kp=self.db)
+        # append the other fields (always url and notes, even if empty) straight to the entry element: its setters
+        # would search the element for the field first, once per field
+        fields = chain((("URL", pass_entry.url), ("Notes", pass_entry.notes)), custom_properties.items())
+        entry._element.extend(E.String(E.Key(key), E.Value(value)) for key, value in fields)
+        entry_group.append(entry)
         return entry
@@ -15,7 +15,9 @@ setup(
         },
     install_requires=[
         'passpy>=1.0rc2',
+        'python-gnupg>=0.4.4',
         'pykeepass>=3.0.3',
+        'lxml>=4.3.0',
         'Rx>=3.0.1',
     ],
     extras_require={
@@ -0,0 +1,40 @@
+from threading import Event
+from types import SimpleNamespace
+
+import pytest
+
+from p2kp2 import PassReader, DecryptionException
+
+
+@pytest.fixture
+def held_store(tmp_path, mocker):
+    """A 20 entries store (e00 to e19), decrypted by 2 workers with a mocked gpg.
+
+    Every entry after the first one is held until the reader is stopped, while the ones added to the failing
+    set raise a DecryptionException right away. Return the store path, the failing set, the list of the entries
+    whose decryption started and an event set when parse_db returns.
+    """
+    for i in range(20):
+        (tmp_path / f"e{i:02}.gpg").touch()
+    mocker.patch.object(PassReader, "get_gpg")
+    mocker.patch("os.cpu_count", return_value=1)
+    store = SimpleNamespace(path=str(tmp_path), failing=set(), decrypted=[], parsed=Event())
+
+    def parse_pass_entry(reader, entry):
+        store.decrypted.append(entry)
+        if entry in store.failing:
+            raise DecryptionException(entry)
+        # if the reader is never stopped, fail instead of hanging the whole suite
+        if entry != "e00" and not reader._stopping.wait(timeout=10):
+            raise TimeoutError(f"'{entry}' was held, but the reader was never stopped")
+        return entry
+    mocker.patch.object(PassReader, "parse_pass_entry", autospec=True, side_effect=parse_pass_entry)
+    parse_db = PassReader.parse_db
+
+    def parse_db_and_notify(reader):
+        try:
+            parse_db(reader)
+        finally:
+            store.parsed.set()
+    mocker.patch.object(PassReader, "parse_db", autospec=True, side_effect=parse_db_and_notify)
+    return store
@@ -2,7 +2,7 @@ import os
 
 import pytest
 
-from p2kp2 import PassReader, PassEntry
+from p2kp2 import PassReader, PassEntry, DecryptionException
 
 
 class TestPassReaderInit:
@@ -44,18 +44,85 @@ class TestPassReader:
         assert "docs/test3" in entries
         assert "web/emails/test4" in entries
 
+    def test_get_pass_entries_should_keep_the_pass_order(self):
+        """Pass reader get pass entries should keep the pass order."""
+        assert self.pr.get_pass_entries() == ["test1", "docs/test3", "web/test2", "web/emails/test4"]
+
+    def test_get_pass_entries_should_scan_the_store_only_once(self, mocker):
+        """Pass reader get pass entries should scan the store only once."""
+        pr = PassReader(path="tests/password-store")
+        spy = mocker.spy(pr, "iter_pass_entries")
+        assert pr.get_pass_entries() == pr.get_pass_entries()
+        assert spy.call_count == 1
+
+    def test_get_pass_entries_should_follow_symlinked_folders(self, tmp_path):
+        """Pass reader get pass entries should follow symlinked folders, but not loops."""
+        shared = tmp_path / "shared"
+        shared.mkdir()
+        (shared / "e2.gpg").touch()
+        store = tmp_path / "store"
+        store.mkdir()
+        (store / "e1.gpg").touch()
+        (store / "team").symlink_to(shared)
+        (shared / "loop").symlink_to(shared)
+        assert sorted(PassReader(path=str(store)).get_pass_entries()) == ["e1", "team/e2"]
+
+    def test_get_pass_entries_should_resolve_only_symlinked_folders(self, mocker, tmp_path):
+        """Pass reader get pass entries should resolve the real path of symlinked folders only."""
+        (tmp_path / "store" / "web" / "emails").mkdir(parents=True)
+        (tmp_path / "shared").mkdir()
+        (tmp_path / "store" / "team").symlink_to(tmp_path / "shared")
+        pr = PassReader(path=str(tmp_path / "store"))
+        realpath = mocker.spy(os.path, "realpath")
+        pr.get_pass_entries()
+        assert [call[0][0] for call in realpath.call_args_list] == [str(tmp_path / "store"),
+                                                                     str(tmp_path / "store" / "team")]
+
+    def test_get_pass_entries_should_skip_broken_entries(self, tmp_path):
+        """Pass reader get pass entries should skip dangling links and non files."""
+        (tmp_path / "e1.gpg").touch()
+        (tmp_path / "dangling.gpg").symlink_to(tmp_path / "missing.gpg")
+        assert PassReader(path=str(tmp_path)).get_pass_entries() == ["e1"]
+
     def test_parse_pass_entry_should_return_a_pass_entry_object(self):
         """Pass reader parse pass entry should return a PassEntry object."""
         entry = self.pr.parse_pass_entry("test1")
         assert type(entry) is PassEntry
         assert entry.title == "test1"
 
+    def test_parse_db_should_publish_every_parsed_entry(self):
+        """Pass reader parse db should publish every parsed entry on the entry stream, in the store order."""
+        pr = PassReader(path="tests/password-store")
+        published = []
+        pr.entry_stream.subscribe(published.append)
+        pr.parse_db()
+        assert published == pr.entries
+
+    def test_parse_db_should_stop_at_the_first_decryption_error(self, mocker):
+        """Pass reader parse db should stop at the first decryption error, before decrypting the others."""
+        pr = PassReader(path="tests/password-store")
+        gpg = mocker.patch.object(pr, "get_gpg").return_value
+        gpg.decrypt_file.return_value.ok = False
+        with pytest.raises(DecryptionException):
+            pr.parse_db()
+        assert gpg.decrypt_file.call_count == 1
+        assert pr.entries == []
+
+    def test_parse_db_should_not_decrypt_the_remaining_entries_after_an_error(self, held_store):
+        """Pass reader parse db should not decrypt the remaining entries after an error."""
+        held_store.failing.add("e01")
+        with pytest.raises(DecryptionException):
+            PassReader(path=held_store.path).parse_db()
+        # at most the failed one and the ones the two workers were already holding
+        assert set(held_store.decrypted) <= {"e00", "e01", "e02", "e03"}
+
     def test_should_be_able_to_parse_the_db_with_parse_db(self):
         """Pass reader should be able to parse the db with parse db."""
         self.pr.parse_db()
         entries = self.pr.entries
         entries_name = list(map(lambda x: x.title, entries))
         assert len(entries) == 4
+        assert entries_name == ["test1", "test3", "test2", "test4"]  # same order as the store
         assert "test1" in entries_name
         assert "test2" in entries_name
         assert "test3" in entries_name
@@ -98,14 +165,19 @@ class TestPassEntry:
         entry = 'F_Yq^5vgeyMCgYf-tW\\!T7Uj|\n---\nurl: someurl.com\n'
         assert decrypted_entry == entry
 
-    def test_should_be_able_to_recognize_a_valid_entry_line(self):
-        """Pass entry should be able to recognize a valid entry line."""
-        assert PassEntry.is_valid_line("some: valid line") is True
-        assert PassEntry.is_valid_line("some NOT valid line") is False
+    def test_should_raise_an_error_if_gpg_fails_to_decrypt_the_entry(self, mocker):
+        """Pass entry should raise an error if gpg fails to decrypt the entry (mocked gpg result)."""
+        pr = PassReader(path="tests/password-store")
+        mocker.patch.object(pr, "get_gpg").return_value.decrypt_file.return_value.ok = False
+        with pytest.raises(DecryptionException):
+            PassEntry.decrypt_entry(pr, "test1")
 
-    def test_should_be_able_to_parse_a_valid_entry_line(self):
-        """Pass entry should be able to parse a valid entry line."""
-        assert PassEntry.parse_entry_line("some: valid line") == ("some", "valid line")
+    def test_should_only_parse_lines_in_the_key_value_format(self):
+        """Pass entry should only parse lines in the 'key: value' format."""
+        entry = PassEntry(self.pr, "test1")
+        entry.custom_properties = []
+        entry.parse_entry_string("somepassword\nsome NOT valid line\n: no key\nsome: valid: line\n")
+        assert entry.custom_properties == [("some", "valid: line")]
 
     def test_should_correctly_parse_all_relevant_data(self):
         """Pass entry should correctly parse all relevant data."""
@@ -114,4 +186,4 @@ class TestPassEntry:
         assert entry.url == "someurl.com"
         assert entry.user == "myusername"
         assert entry.notes == "some notes something interesting"
-        assert entry.custom_properties["cell_number"] == "00000000"
+        assert entry.custom_properties == [("cell_number", "00000000")]
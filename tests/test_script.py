@@ -1,8 +1,16 @@
+import os
 import sys
+from argparse import Namespace
+from types import SimpleNamespace
 
 import pytest
+from pykeepass import PyKeePass
+from rx.subject import Subject
 
-from p2kp2.pass2keepass2 import main_func
+from p2kp2 import PassReader, P2KP2
+from p2kp2.pass2keepass2 import main_func, exec_quick_mode, stream_entries, print_conversion_progress
+
+test_db_file = "tests/test-script-db.kdbx"
 
 
 @pytest.mark.runthis
@@ -31,3 +39,116 @@ class TestMainFunc:
         assert named_args.quick is False
         assert mocked_quick_mode.call_count == 0
 
+
+class TestStreamEntries:
+    """Test: stream_entries..."""
+
+    def test_should_stream_all_entries_and_then_stop(self, mocker):
+        """Stream entries should stream all the parsed entries and then stop."""
+        reader = PassReader(path="tests/password-store")
+
+        def parse_db():
+            for entry in ["entry0", "entry1", "entry2"]:
+                reader.entry_stream.on_next(entry)
+        mocker.patch.object(reader, "parse_db", side_effect=parse_db)
+        assert list(stream_entries(reader)) == ["entry0", "entry1", "entry2"]
+
+    def test_should_raise_the_parse_db_errors(self, mocker):
+        """Stream entries should raise the parse_db errors, after the entries parsed before them."""
+        reader = PassReader(path="tests/password-store")
+
+        def parse_db():
+            reader.entry_stream.on_next("entry0")
+            raise RuntimeError("decryption failed")
+        mocker.patch.object(reader, "parse_db", side_effect=parse_db)
+        entries = stream_entries(reader)
+        assert next(entries) == "entry0"
+        with pytest.raises(RuntimeError):
+            next(entries)
+
+    def test_should_stop_the_parsing_when_closed(self, held_store):
+        """Stream entries should stop the parsing when closed."""
+        entries = stream_entries(PassReader(path=held_store.path))
+        assert next(entries) == "e00"
+        entries.close()
+        assert held_store.parsed.wait(timeout=10)
+        assert set(held_store.decrypted) <= {"e00", "e01", "e02"}  # at most the ones the two workers were holding
+
+
+class TestPrintConversionProgress:
+    """Test: print_conversion_progress..."""
+
+    def test_should_print_both_progresses_only_when_they_change(self, mocker, capsys):
+        """Print conversion progress should print both progresses, only when they change."""
+        reader = PassReader(path="tests/password-store")
+        mocker.patch.object(reader, "get_pass_entries", return_value=["entry0", "entry1"])
+        writer = SimpleNamespace(event_stream=Subject())
+        print_conversion_progress(reader, writer)
+        reader.event_stream.on_next(1)
+        reader.event_stream.on_next(1)
+        writer.event_stream.on_next(1)
+        reader.event_stream.on_next(2)
+        writer.event_stream.on_next(2)
+        lines = capsys.readouterr().out.split("\r")
+        assert lines == [" > Converting password-store... read 50%, written 0%",
+                         " > Converting password-store... read 50%, written 50%",
+                         " > Converting password-store... read 100%, written 50%",
+                         " > Converting password-store... read 100%, written 100%",
+                         ""]
+
+
+class TestQuickMode:
+    """Test: quick mode..."""
+
+    def test_should_stop_and_clean_up_when_interrupted(self, mocker, held_store):
+        """Quick mode should stop decrypting and delete the partial db when interrupted."""
+        mocker.patch("p2kp2.pass2keepass2.getpass", return_value="somepass")
+        mocker.patch.object(P2KP2, "add_entry", side_effect=SystemExit(0))  # like the sigint handler does
+        args = Namespace(input=held_store.path, output=test_db_file, force_overwrite=False)
+        with pytest.raises(SystemExit):
+            exec_quick_mode(args)
+        assert not os.path.exists(test_db_file)
+        assert held_store.parsed.wait(timeout=10)
+        assert set(held_store.decrypted) <= {"e00", "e01", "e02"}
+
+    def test_should_not_leave_a_partial_db_behind_when_decryption_fails(self, mocker):
+        """Quick mode should not leave a partial db behind when decryption fails."""
+        mocker.patch("p2kp2.pass2keepass2.getpass", return_value="somepass")
+        mocker.patch.object(PassReader, "parse_db", side_effect=RuntimeError("decryption failed"))
+        args = Namespace(input="tests/password-store", output=test_db_file, force_overwrite=False)
+        with pytest.raises(SystemExit):
+            exec_quick_mode(args)
+        assert not os.path.exists(test_db_file)
+
+    def test_should_not_touch_an_existing_db_when_the_conversion_fails(self, mocker, tmp_path):
+        """Quick mode should not touch an existing db when the conversion fails, even if forced to overwrite it."""
+        existing_db = tmp_path / "existing.kdbx"
+        existing_db.write_bytes(b"existing db")
+        mocker.patch("p2kp2.pass2keepass2.getpass", return_value="somepass")
+        args = Namespace(input=str(tmp_path / "missing-store"), output=str(existing_db), force_overwrite=True)
+        with pytest.raises(SystemExit):
+            exec_quick_mode(args)
+        assert existing_db.read_bytes() == b"existing db"
+        assert os.listdir(str(tmp_path)) == ["existing.kdbx"]  # no temporary db left behind
+
+    def test_should_replace_an_existing_db_when_forced_to(self, mocker, tmp_path):
+        """Quick mode should replace an existing db with the converted one when forced to overwrite it."""
+        existing_db = tmp_path / "existing.kdbx"
+        existing_db.write_bytes(b"existing db")
+        mocker.patch("p2kp2.pass2keepass2.getpass", return_value="somepass")
+        args = Namespace(input="tests/password-store", output=str(existing_db), force_overwrite=True)
+        exec_quick_mode(args)
+        assert len(PyKeePass(str(existing_db), password="somepass").entries) == 4
+        assert os.listdir(str(tmp_path)) == ["existing.kdbx"]
+
+    def test_should_create_the_db_with_the_usual_file_mode(self, mocker, tmp_path):
+        """Quick mode should create the db with the same file mode normal mode gives it."""
+        umask = os.umask(0o022)
+        os.umask(umask)
+        new_db = tmp_path / "new.kdbx"
+        mocker.patch("p2kp2.pass2keepass2.getpass", return_value="somepass")
+        args = Namespace(input="tests/password-store", output=str(new_db), force_overwrite=False)
+        exec_quick_mode(args)
+        assert os.stat(str(new_db)).st_mode & 0o777 == 0o666 & ~umask
+        assert len(PyKeePass(str(new_db), password="somepass").entries) == 4
+        assert os.listdir(str(tmp_path)) == ["new.kdbx"]
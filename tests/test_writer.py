@@ -5,7 +5,7 @@ from pykeepass import PyKeePass
 from pykeepass.entry import Entry
 from pykeepass.group import Group
 
-from p2kp2 import P2KP2, DbAlreadyExistsException, PassReader, PassEntry, empty_db_path
+from p2kp2 import P2KP2, DbAlreadyExistsException, ReservedKeyException, PassReader, PassEntry, empty_db_path
 
 test_pass = "somesecurepassword"
 test_db_file = "tests/test-db.kdbx"
@@ -74,7 +74,8 @@ class TestP2kp2Init:
 
     def test_should_set_the_given_password(self):
         """P2kp2 should set the given password."""
-        P2KP2(password=test_pass, destination=test_db_file)
+        p2kp2 = P2KP2(password=test_pass, destination=test_db_file)
+        p2kp2.db.save()
         PyKeePass(test_db_file, password=test_pass)  # this will fail if the pass is wrong
 
     def test_should_overwrite_an_already_present_db_if_instructed_to_do_so(self):
@@ -149,7 +150,7 @@ class TestP2Kp2AddEntry:
 
     def test_should_correctly_set_custom_properties(self):
         """P2kp2 add_entry should correctly set custom properties."""
-        for key, value in self.pass_entry0.custom_properties.items():
+        for key, value in self.pass_entry0.custom_properties:
             assert self.entry0.get_custom_property(key) == value
 
     def test_should_correctly_set_the_url(self):
@@ -160,6 +161,64 @@ class TestP2Kp2AddEntry:
         """P2kp2 add_entry should correctly set the notes."""
         assert self.entry0.notes == self.pass_entry0.notes
 
+    def test_should_always_set_url_and_notes_even_if_empty(self):
+        """P2kp2 add_entry should always set url and notes, even if empty."""
+        assert self.pass_entry1.url == "" and self.pass_entry1.notes == ""
+        assert self.entry1.url == ""
+        assert self.entry1.notes == ""
+
+    def test_should_write_every_field_only_once(self):
+        """P2kp2 add_entry should write every field only once."""
+        keys = [string.find("Key").text for string in self.entry0._element.findall("String")]
+        assert len(keys) == len(set(keys))
+        assert {"Title", "UserName", "Password", "URL", "Notes", "cell_number"} <= set(keys)
+
+    def test_should_refuse_custom_properties_named_like_standard_fields(self):
+        """P2kp2 add_entry should refuse custom properties named like standard fields, instead of overwriting them."""
+        pass_entry = PassEntry(self.reader, "test1")
+        pass_entry.custom_properties = []
+        pass_entry.parse_entry_string("realsecret\nPassword: oldsecret\n")
+        nentries = len(self.p2kp2.db.entries)
+        with pytest.raises(ReservedKeyException):
+            self.p2kp2.add_entry(pass_entry)
+        assert len(self.p2kp2.db.entries) == nentries
+
+
+class TestP2Kp2AddEntries:
+    """Test: P2kp2 add_entries..."""
+
+    pass_entry: PassEntry
+
+    @pytest.fixture(scope="class", autouse=True)
+    def setup(self, request):
+        """TestP2Kp2AddEntries setup"""
+        request.cls.pass_entry = PassEntry(PassReader(path="tests/password-store"), "test1")
+
+    @pytest.mark.usefixtures("reset_db_every_test")
+    def test_should_save_the_db_even_when_an_error_happens_mid_stream(self, mocker):
+        """P2kp2 add_entries should save the db even when an error happens mid stream."""
+        def pass_entries():
+            yield self.pass_entry
+            raise RuntimeError("decryption failed")
+        p2kp2 = P2KP2(password=test_pass, destination=test_db_file)
+        save = mocker.spy(p2kp2.db, "save")
+        with pytest.raises(RuntimeError):
+            p2kp2.add_entries(pass_entries())
+        assert save.call_count == 1
+        assert len(PyKeePass(test_db_file, password=test_pass).entries) == 1
+
+    @pytest.mark.usefixtures("reset_db_every_test")
+    def test_should_not_save_the_db_on_errors_if_instructed_to_do_so(self, mocker):
+        """P2kp2 add_entries should not save the db on errors if instructed to do so."""
+        def pass_entries():
+            yield self.pass_entry
+            raise RuntimeError("decryption failed")
+        p2kp2 = P2KP2(password=test_pass, destination=test_db_file)
+        save = mocker.spy(p2kp2.db, "save")
+        with pytest.raises(RuntimeError):
+            p2kp2.add_entries(pass_entries(), save_on_error=False)
+        assert save.call_count == 0
+
 
 class TestP2Kp2:
     """Test: P2kp2..."""